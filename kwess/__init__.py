@@ -1,15 +1,324 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError
 import sys
-from pprint import pprint
-from datetime import datetime as dt, timezone as tz, timedelta as td
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime as dt, timedelta as td, timezone
 import time
 import json
-    
+import os
+import shelve
+import dbm
+import threading
+import asyncio
+import logging
+import reprlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+# console output of the verbose parameter, for callers whose kwess logger would drop its messages
+_console = logging.getLogger(f"{__name__}.verbose")
+_console.propagate = False
+_console.setLevel(logging.DEBUG)
+_console_handler = logging.StreamHandler(sys.stdout)
+_console_handler.setFormatter(logging.Formatter("%(message)s"))
+_console.addHandler(_console_handler)
+
+# verbose output of responses, cut down to a readable size
+_repr = reprlib.Repr()
+_repr.maxlist = _repr.maxdict = 20
+_repr.maxstring = 120
+
+# errors raised by the api client, whether it is a requests session or an httpx client
+_REQUEST_ERRORS = (requests.exceptions.RequestException,) if httpx is None else (requests.exceptions.RequestException, httpx.HTTPError)
+# errors worth sending the request again for, by the clients that do not retry on their own
+_CONNECTION_ERRORS = (requests.exceptions.ConnectionError,) if httpx is None else (requests.exceptions.ConnectionError, httpx.NetworkError)
+_CONNECTION_RETRIES = 2
+_RETRY_BACKOFF = 0.5
+# throttled or failed responses worth waiting for and sending the request again
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Questrade datetime strings end with the utc offset as "+hh:mm"
+_GMT_OFFSET_FMT = "+00:00"
+
+# number of seconds a cached response stays valid, by kind of data
+_TTL = {"balances": 10, "positions": 10, "time": 1, "quotes": 1, "symbols": 3600, "markets": 86400}
+_CACHE_MAXSIZE = 4096
+
+# get_account_orders statefilter values, by first letter
+_STATEFILTER = {"o": "Open", "c": "Closed", "a": "All"}
+
+
+def _loads(content):
+    """
+    Description:
+        Parses json bytes, with orjson when it is installed.
+    Parameters:
+        - content json document as bytes.
+    Returns:
+        The Python object representation of the json.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _dumps(obj, indent=True):
+    """
+    Description:
+        Serializes an object to json bytes, with orjson when it is installed.
+    Parameters:
+        - obj Python object representation of a json document.
+        - indent optional boolean. Set indent to False for compact json, such as request bodies.
+        Defaults to True.
+    Returns:
+        The json document as utf-8 encoded bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2) if indent else orjson.dumps(obj)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=4).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _windows(startdatetime, enddatetime=None):
+    """
+    Description:
+        Splits a datetime range into windows that fit the 30 day range limit imposed by Questrade.
+    Parameters:
+        - startdatetime datetime object representing the beginning of a range.
+        - enddatetime optional datetime object representing the end of a range.
+        Defaults to now if not specified.
+    Returns:
+        A list of (start, end) datetime tuples: consecutive 29 day windows, followed by whatever
+        remains of the range. The windows include both their start and end, and each one starts
+        1 second (the precision of Questrade datetime strings) after the end of the previous one,
+        so that no instant, such as midnight, falls in two windows. A range that ends before it
+        starts is returned as a single window.
+    """
+    if enddatetime == None:
+        enddatetime = dt.now(startdatetime.tzinfo)
+    span = td(days=29)
+    step = span + td(seconds=1)
+    n = 0
+    if enddatetime - startdatetime > span:
+        n, rest = divmod(enddatetime - startdatetime - span, step)
+        n += 1 if rest else 0
+    windows = [(startdatetime + step * i, startdatetime + step * i + span) for i in range(n)]
+    last = startdatetime + step * n
+    if not windows or last < enddatetime:
+        windows.append((last, enddatetime))
+    else: # at most a second remains: the last window takes it, rather than an empty window
+        windows[-1] = (windows[-1][0], enddatetime)
+    return windows
+
+
+def _log_data(logger, obj, verbosity):
+    """
+    Description:
+        Logs a Python object representation of json for the verbose modes. Large responses are
+        shortened to their first items, unless the verbosity is 3 ("vvv") or more.
+    Parameters:
+        - logger logger of the messages, as returned by _v.
+        - obj Python object to log.
+        - verbosity level of verbosity, as returned by _v.
+    """
+    if verbosity > 2:
+        from pprint import pformat
+        logger.info("%s", pformat(obj))
+    else:
+        logger.info("%s", _repr.repr(obj))
+
+
+def _retry_delay(attempt, headers=None):
+    """
+    Description:
+        Computes how long to wait before sending a request again: an exponential backoff, or
+        longer if the Retry-After header of the response asks for it.
+    Parameters:
+        - attempt number of the failed attempt, starting at 0.
+        - headers optional response headers.
+    Returns:
+        The number of seconds to wait.
+    """
+    delay = _RETRY_BACKOFF * 2 ** attempt
+    retry_after = headers.get("Retry-After", "") if headers is not None else ""
+    return max(delay, float(retry_after)) if retry_after.isdigit() else delay
+
+
+def _unsent(ex):
+    """
+    Description:
+        Tells whether a failed request never reached the server: its connection timed out, was
+        refused, or its host name could not be resolved.
+    Parameters:
+        - ex exception raised by requests.
+    Returns:
+        True if the request was not sent, False if it may have been.
+    """
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(ex.args[0], "reason", ex.args[0]) if ex.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _retries():
+    """
+    Description:
+        Builds the retry policy of the requests connection pool: throttled (429) and failed (5xx)
+        GET and POST requests are sent again with an exponential backoff, waiting at least as
+        long as the Retry-After header of the response asks.
+    Returns:
+        A urllib3 Retry object.
+    """
+    policy = dict(total=5, backoff_factor=_RETRY_BACKOFF, status_forcelist=_RETRY_STATUS, respect_retry_after_header=True, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=frozenset(["GET", "POST"]), **policy)
+    except TypeError: # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(["GET", "POST"]), **policy)
+
+
+def _v(verbose):
+    """
+    Description:
+        Converts a verbose string into its level of verbosity, and picks the logger of its messages
+        (info messages, and debug messages from a verbosity of 2).
+        Without verbose, the kwess logger decides: a verbosity of 2 if it logs debug messages, of 1
+        if it logs info messages, or else of 0.
+        With verbose, the messages go to the kwess logger if it logs them, or else are printed on
+        the console, without changing the configuration of the kwess logger.
+    Parameters:
+        - verbose level of verbosity represented by the number of characters in a string.
+    Returns:
+        A (verbosity, logger) tuple: the level of verbosity as an integer, and the logger to use.
+    """
+    if not verbose:
+        if log.isEnabledFor(logging.DEBUG):
+            return 2, log
+        return (1 if log.isEnabledFor(logging.INFO) else 0), log
+    verbosity = len(verbose)
+    level = logging.DEBUG if verbosity > 1 else logging.INFO
+    return verbosity, (log if log.isEnabledFor(level) else _console)
+
+
+def _validators(headers):
+    """
+    Description:
+        Builds the conditional request headers that ask the server whether a response changed.
+    Parameters:
+        - headers response headers.
+    Returns:
+        A dictionary with the If-None-Match and/or If-Modified-Since headers, or None if the
+        response has neither an ETag nor a Last-Modified header.
+    """
+    validators = {}
+    if headers.get("ETag"):
+        validators["If-None-Match"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["If-Modified-Since"] = headers["Last-Modified"]
+    return validators or None
+
+
+def _ids_query(url, ids):
+    """
+    Description:
+        Builds the query of one or more symbol ids: a single id goes in the path of the endpoint,
+        several ids go in its ids parameter.
+    Parameters:
+        - url the endpoint to query, such as the quotes or the symbols endpoint.
+        - ids a single id (number or string), a list or tuple of ids, or a string of comma
+        separated ids.
+    Returns:
+        A (url, params) tuple, params being None for a single id, or (None, None) if ids is empty.
+    """
+    if isinstance(ids, (list, tuple)):
+        return (url, {'ids': ",".join(map(str, ids))}) if ids else (None, None)
+    if isinstance(ids, int) or (isinstance(ids, str) and ids and "," not in ids):
+        return f"{url}/{ids}", None
+    return (url, {'ids': ids}) if ids else (None, None)
+
+
+def _id_list(ids):
+    """
+    Description:
+        Converts a collection of ids into a list of strings.
+    Parameters:
+        - ids list (or any iterable) of ids, or a string of comma separated ids.
+    Returns:
+        A list of non empty id strings, in the order of ids.
+    """
+    if isinstance(ids, str):
+        return [i for i in ids.split(",") if i]
+    return [i for i in map(str, ids) if i]
+
+
+def _chunks(ids, size):
+    """
+    Description:
+        Splits a collection of ids into strings of at most size comma separated ids.
+    Parameters:
+        - ids list (or any iterable) of ids, or a string of comma separated ids.
+        - size maximum number of ids per string.
+    Returns:
+        A list of strings of comma separated ids, in the order of ids.
+    """
+    ids = _id_list(ids)
+    size = max(1, int(size))
+    return [",".join(ids[i:i + size]) for i in range(0, len(ids), size)]
+
+
+def _atomic_write(path, data):
+    """
+    Description:
+        Writes data to a temporary file next to path, then renames it to path, so that path
+        never holds a partially written content. The file keeps the permissions of the file it
+        replaces, and a new file is only readable by its owner, since it holds tokens.
+    Parameters:
+        - path name of the file to write.
+        - data bytes to write.
+    """
+    tmp = f"{path}.tmp"
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o600
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, mode="wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
 
 
 class Trader:
-    def __init__(self, rt_file="refreshToken", server_type="live", timeout=15, verbose=''):
+    def __init__(self, rt_file="refreshToken", server_type="live", timeout=15, max_workers=8, candles_cache="~/.kwess_cache", http2=False, verbose=''):
         """
         Description:
             Initializer of a Trader object. Before creating a Trader object for the very first time,
@@ -37,6 +346,15 @@ class Trader:
             account.
             - timeout number of seconds to wait for the server to respond before giving up.
             Defaults to 15 seconds. Set timeout to None if you wish to wait forever for a response.
+            - max_workers maximum number of concurrent requests issued by the generators that
+            query ranges longer than 30 days. Defaults to 8. Set max_workers to 1 to query the
+            30 day chunks one after the other.
+            - candles_cache name of a local file used to keep the market candles of ranges that ended
+            in the past, since those never change. Defaults to "~/.kwess_cache".
+            Set candles_cache to None to always query the server.
+            - http2 optional boolean to send the api calls over a single multiplexed HTTP/2
+            connection, with httpx instead of requests. Requires httpx[http2].
+            Defaults to False.
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 1 or "v".
         Returns:
@@ -48,43 +366,95 @@ class Trader:
         }
         self.rt_file = rt_file
         self.timeout = timeout
+        self.max_workers = max_workers
+        self.http2 = http2
+        self.candles_cache = os.path.expanduser(candles_cache) if candles_cache else None
+        self._candles_lock = threading.Lock()
+        self._cache = OrderedDict() # request key, or (kind, id) of a bulk item -> (expiry, json, conditional request headers)
+        self._cache_lock = threading.Lock()
+        self._inflight = {} # request key -> (event set once answered, [json]) of cacheable requests on their way
+        self._inflight_lock = threading.Lock()
         self.server_type = server_type
+        if http2:
+            if httpx is None:
+                self._report_and_exit("http2=True requires httpx: python -m pip install kwess[http2]")
+            # concurrent api calls share one HTTP/2 connection
+            self._pool_maxsize = 20
+            self._session = httpx.Client(http2=True, limits=httpx.Limits(max_connections=self._pool_maxsize, max_keepalive_connections=10), timeout=self.timeout)
+        else:
+            # one pooled session for all API calls, so the TLS connection to the api server is reused.
+            # It is sized once: replacing the adapter of a session in use would cut its connections
+            self._pool_maxsize = max(32, max_workers)
+            self._session = requests.Session()
+            self._session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=self._pool_maxsize, max_retries=_retries()))
         try:
-            with open("accessToken.json", mode="r", encoding="utf-8") as fp:
-                rd = json.load(fp)
-                self.access_token = rd["access_token"]
-                self.token_type = rd["token_type"]
-                self.api_server = rd["api_server"][:-1]
-                self.refresh_token = rd["refresh_token"]
-                self.expires_in = rd["expires_in"]
-                self.expiry_date = rd["expiry_date"]
-                dto = dt.strptime(self.expiry_date, '%Y-%m-%d %X')
-                now = dt.now()
-                if dto >= now:
-                    try:
-                        if verbose:
-                            print("Access token still valid.")
-                        self._get_accounts()
-                        if verbose:
-                            print("Got account(s)")
-                    except:
-                        raise Exception(f"Failed to obtain account(s).\nWill try to exchange refresh token from file {self.rt_file} for new access token/refresh token pair.")
-                else:
-                   raise Exception(f"Access token expired.\nWill try to exchange refresh token from file {self.rt_file} for new access token/refresh token pair.") 
-        except:
+            with open("accessToken.json", mode="rb") as fp:
+                rd = _loads(fp.read())
+            self.access_token = rd["access_token"]
+            self.token_type = rd["token_type"]
+            self.api_server = rd["api_server"][:-1]
+            self.refresh_token = rd["refresh_token"]
+            self.expires_in = rd["expires_in"]
+            self.expiry_date = rd["expiry_date"]
+            self._set_authorization()
+            if "expiry_epoch" in rd:
+                valid = rd["expiry_epoch"] >= time.time()
+            else: # file written by an older kwess
+                valid = dt.fromisoformat(self.expiry_date) >= dt.now()
+            if not valid and verbose:
+                print(f"Access token expired.\nWill try to exchange refresh token from file {self.rt_file} for new access token/refresh token pair.")
+        except (OSError, ValueError, KeyError) as ex:
+            # no usable access token saved: only the refresh token can help
+            valid = False
+            if verbose:
+                print(ex)
+        if valid:
+            try:
+                if verbose:
+                    print("Access token still valid.")
+                self._get_accounts()
+                if verbose:
+                    print("Got account(s)")
+            except _REQUEST_ERRORS as ex:
+                valid = False
+                if verbose:
+                    print(ex)
+                    print(f"Failed to obtain account(s).\nWill try to exchange refresh token from file {self.rt_file} for new access token/refresh token pair.")
+        if not valid:
             try:
                 with open(rt_file, mode="rt", encoding="utf-8") as fp:
                     self.refresh_token = fp.read().strip()
-                    self.get_new_refresh_token(token=self.refresh_token)
-                    self._get_accounts()
-                    if verbose:
-                        print("Got account(s)")
+                self.get_new_refresh_token(token=self.refresh_token)
+                self._get_accounts()
+                if verbose:
+                    print("Got account(s)")
             except Exception as ex:
                 print(ex)
                 print(f"Please log into your Questrade account (APP HUB), generate a new token for manual authorization, and save that token in local file {self.rt_file}, then try again.")
                 sys.exit(1)
             
 
+    def _map(self, f, items, workers):
+        """
+        Description:
+            Calls f on each item from a pool of threads sharing the session. There are no more
+            threads than connections in the pool of the session, so that the threads do not wait
+            on each other for a connection. f must not start threads of its own.
+        Parameters:
+            - f function of one item.
+            - items list of items.
+            - workers maximum number of concurrent calls, up to the size of the connection pool.
+        Returns:
+            The list of the results of f, in the order of items.
+        """
+        items = list(items)
+        if workers <= 1 or len(items) <= 1:
+            return [f(item) for item in items]
+        workers = min(workers, len(items), self._pool_maxsize)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(f, items))
+
+
     def get_new_refresh_token(self, token, verbose=''):
         """
         Description:
@@ -98,42 +468,328 @@ class Trader:
             Defaults to empty string. Maximum verbosity is 1 or "v".
         """
         refresh_parameters = {'grant_type': 'refresh_token', 'refresh_token': token}
+        url = self.server_url[self.server_type]
         try:
-            resp = requests.get(self.server_url[self.server_type], params=refresh_parameters, timeout=self.timeout)
-            resp.raise_for_status()
+            # the authorization server is not the api server: keep it off the authenticated session,
+            # and its retrying pool. The exchange uses up the token: only resend it if it never left
+            resp = self._retrying(lambda: requests.get(url, params=refresh_parameters, timeout=self.timeout), "GET", url, _CONNECTION_RETRIES, retry_error=_unsent, retry_status=())
         except requests.exceptions.RequestException as ex:
-            print(resp.request.url)
-            print(f"{self.server_type} server returned {resp.status_code} on get_new_refresh_token() attempt.")
             print(ex)
             raise Exception()
+        if resp.status_code >= 400:
+            print(resp.url)
+            print(f"{self.server_type} server returned {resp.status_code} on get_new_refresh_token() attempt.")
+            raise Exception()
 
-        rd = resp.json()
+        rd = _loads(resp.content)
         self.access_token = rd["access_token"]
         self.token_type = rd["token_type"]
         self.api_server = rd["api_server"][:-1]
         self.refresh_token = rd["refresh_token"]
         self.expires_in = rd["expires_in"]
+        self._set_authorization()
         if verbose:
             print("Successfully exchanged refresh token for a new one, and a new {} minutes access token.".format(self.expires_in // 60))
 
         try:
-            with open(self.rt_file, mode="wt", encoding="utf-8") as fp:
-                fp.write(self.refresh_token)
+            _atomic_write(self.rt_file, self.refresh_token.encode("utf-8"))
         except Exception as ex:
             print(f"Could not save new refresh token in file {self.rt_file}:")
             print(ex)
         try:
-            with open("accessToken.json", mode="w", encoding='utf-8') as jfp:
-                now = dt.now()
-                self.expiry_date = now + td(seconds=self.expires_in)
-                rd["expiry_date"] = str(self.expiry_date)[:-7]
-                json.dump(rd, jfp, ensure_ascii=False, indent=4)
+            now = dt.now()
+            self.expiry_date = now + td(seconds=self.expires_in)
+            rd["expiry_date"] = str(self.expiry_date)[:-7]
+            rd["expiry_epoch"] = self.expiry_date.timestamp()
+            _atomic_write("accessToken.json", _dumps(rd))
         except Exception as ex:
             print("Could not save new access token in file accessToken.json:")
             print(ex)
             raise Exception()
 
 
+    def _set_authorization(self):
+        """
+        Description:
+            Caches the Authorization header and the accounts, markets and symbols base urls for the
+            current access token, and sets that header on the session. Called whenever the access
+            token is loaded or refreshed.
+        """
+        self._auth_header = f"{self.token_type} {self.access_token}"
+        self._base = f"{self.api_server}/v1/accounts"
+        self._markets_url = f"{self.api_server}/v1/markets"
+        self._symbols_url = f"{self.api_server}/v1/symbols"
+        self._session.headers.update({'Authorization': self._auth_header})
+        self._cache.clear()
+        if getattr(self, "accounts", None) is not None:
+            # the api server may change on refresh
+            self._index_accounts()
+
+
+    def _cache_key(self, url, params=None):
+        """
+        Description:
+            Builds a stable cache key from an endpoint and its parameters, which may hold lists
+            and dictionaries.
+        Parameters:
+            - url the endpoint to query.
+            - params optional dictionary of query parameters.
+        Returns:
+            A string key.
+        """
+        if not params:
+            return url
+        return url + json.dumps(params, sort_keys=True, default=str)
+
+
+    def _cache_lookup(self, key):
+        """
+        Description:
+            Looks up a response that has not expired yet.
+        Parameters:
+            - key cache key built by _cache_key.
+        Returns:
+            The cached Python object representation of the json, or None if not found.
+        """
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        return None
+
+
+    def _cache_stale(self, key):
+        """
+        Description:
+            Looks up an expired response that the server can be asked to confirm is unchanged.
+        Parameters:
+            - key cache key built by _cache_key.
+        Returns:
+            A (json, headers) tuple: the cached Python object representation of the json and the
+            If-None-Match/If-Modified-Since headers to send, or (None, None) if not found.
+        """
+        hit = self._cache.get(key)
+        if hit is not None and hit[2]:
+            return hit[1], hit[2]
+        return None, None
+
+
+    def _cache_store(self, key, rd, ttl, validators=None):
+        """
+        Description:
+            Keeps a response for ttl seconds. When the cache is full, the responses stored first
+            are dropped. Expired responses are only dropped that way, or replaced, since lookups
+            check the expiry and revalidation needs them.
+        Parameters:
+            - key cache key built by _cache_key.
+            - rd Python object representation of the returned json.
+            - ttl number of seconds the response stays valid.
+            - validators optional dictionary of the conditional request headers that revalidate
+            the response once it has expired.
+        """
+        expiry = time.monotonic() + ttl
+        with self._cache_lock: # map_* methods store from several threads
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            elif len(self._cache) >= _CACHE_MAXSIZE:
+                self._cache.popitem(last=False)
+            self._cache[key] = (expiry, rd, validators)
+
+
+    def _request(self, method, url, params=None, json_body=None, ttl=0, what="", caller="", revalidate=False):
+        """
+        Description:
+            Sends one request to the api server, unless the same request was answered less than ttl
+            seconds ago. A request that cannot reach the server, or that is throttled or fails on
+            the server side, is sent again: by the connection pool of the requests session, or
+            twice by _retrying with httpx. Reports the failure and exits if the request still fails.
+        Parameters:
+            - method "GET" or "POST".
+            - url the endpoint to query.
+            - params optional dictionary of query parameters.
+            - json_body optional Python object sent as json body.
+            - ttl number of seconds a response stays valid. Defaults to 0 (no caching).
+            - what description of the queried data, used in the failure message.
+            - caller name of the calling method, used in the failure message.
+            - revalidate optional boolean. Once a response has expired, ask the server whether it
+            changed (with its ETag/Last-Modified), and reuse it on a 304 reply. Defaults to False.
+        Returns:
+            The Python object representation of the returned json.
+        """
+        if ttl <= 0:
+            return self._send(method, url, params, json_body, what=what, caller=caller)
+        key = self._cache_key(url, params if json_body is None else json_body)
+        rd = self._cache_lookup(key)
+        if rd is not None:
+            return rd
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = (threading.Event(), [])
+        event, answer = flight
+        if not leader:
+            # the same request is already on its way (from another thread): wait for its answer
+            event.wait()
+            if answer:
+                return answer[0]
+        try:
+            rd = self._send(method, url, params, json_body, ttl, key, what, caller, revalidate)
+            answer.append(rd)
+            return rd
+        finally:
+            if leader:
+                with self._inflight_lock:
+                    del self._inflight[key]
+                event.set()
+
+
+    def _send(self, method, url, params=None, json_body=None, ttl=0, key=None, what="", caller="", revalidate=False):
+        """
+        Description:
+            Sends a request for _request, and caches its response under key for ttl seconds.
+        Parameters:
+            - key cache key built by _cache_key, if ttl is set.
+            - other parameters same as _request.
+        Returns:
+            The Python object representation of the returned json.
+        """
+        stale, headers = None, None
+        if ttl > 0 and revalidate:
+            stale, headers = self._cache_stale(key)
+        body = {}
+        if json_body is not None:
+            # serialized once, with orjson when installed, rather than by the http client on each try
+            body = {"data" if isinstance(self._session, requests.Session) else "content": _dumps(json_body, indent=False)}
+            headers = {**(headers or {}), 'Content-Type': "application/json"}
+        # the connection pool of a requests session already retries (see _retries), httpx does not
+        retries = 0 if isinstance(self._session, requests.Session) else _CONNECTION_RETRIES
+        try:
+            resp = self._retrying(lambda: self._session.request(method, url, params=params, headers=headers, timeout=self.timeout, **body), method, url, retries)
+        except _REQUEST_ERRORS as ex:
+            self._report_and_exit(f"Failed to query server for {what}.", ex)
+        if resp.status_code == 304 and stale is not None:
+            # unchanged: no body was sent, keep the cached one for another ttl
+            self._cache_store(key, stale, ttl, headers)
+            return stale
+        if resp.status_code >= 400:
+            self._report_and_exit(resp.url, resp.text, f"Failed to query server for {what}.", f"{self.server_type} server returned {resp.status_code} on {caller}().")
+
+        rd = _loads(resp.content)
+        if ttl > 0:
+            self._cache_store(key, rd, ttl, _validators(resp.headers) if revalidate else None)
+        return rd
+
+
+    def _retrying(self, send, method, url, retries, retry_error=None, retry_status=_RETRY_STATUS):
+        """
+        Description:
+            Sends a request, and sends it again up to retries times while it cannot reach the
+            server, or while the server replies with a throttled (429) or failed (5xx) status.
+        Parameters:
+            - send function of no argument that sends the request and returns its response.
+            - method "GET" or "POST", used in the log messages.
+            - url the queried endpoint, used in the log messages.
+            - retries maximum number of times the request is sent again.
+            - retry_error optional function of a connection error, telling whether it is worth
+            sending the request again. Defaults to None: every connection error is.
+            - retry_status optional collection of the status codes worth sending the request
+            again for. Defaults to 429 and the 5xx errors.
+        Returns:
+            The last response, whatever its status code.
+        Raises:
+            The exception raised by send, once the retries are exhausted, or right away if it is
+            not a connection error worth retrying.
+        """
+        for attempt in range(retries + 1):
+            try:
+                resp = send()
+            except _CONNECTION_ERRORS as ex:
+                if attempt == retries or (retry_error is not None and not retry_error(ex)):
+                    raise
+                log.debug("Retrying %s %s: %s", method, url, ex)
+                time.sleep(_retry_delay(attempt))
+                continue
+            if resp.status_code not in retry_status or attempt == retries:
+                return resp
+            log.debug("Retrying %s %s: server returned %s", method, url, resp.status_code)
+            time.sleep(_retry_delay(attempt, resp.headers))
+
+
+    def _bulk_lookup(self, kind, ids, cache=True):
+        """
+        Description:
+            Splits the ids of a bulk query between those whose quote or symbol is still cached
+            on its own, and those that need to be queried.
+        Parameters:
+            - kind "quote" or "symbol".
+            - ids list of ids, or a string of comma separated ids.
+            - cache optional boolean. Set cache to False to query all the ids. Defaults to True.
+        Returns:
+            A (ids, found, missing) tuple: the ids as a list of strings, a dictionary of the cached
+            items by id, and the list of the ids left to query, without duplicates.
+        """
+        ids = _id_list(ids)
+        found = {}
+        if cache:
+            for i in ids:
+                item = self._cache_lookup((kind, i))
+                if item is not None:
+                    found[i] = item
+        missing = [i for i in dict.fromkeys(ids) if i not in found]
+        return ids, found, missing
+
+
+    def _bulk_merge(self, kind, ids, found, items, ttl=0):
+        """
+        Description:
+            Caches each queried quote or symbol on its own, and merges them with the cached ones.
+        Parameters:
+            - kind "quote" or "symbol".
+            - ids list of id strings, as returned by _bulk_lookup.
+            - found dictionary of the cached items by id, as returned by _bulk_lookup.
+            - items list of the queried items.
+            - ttl number of seconds the queried items stay valid. Defaults to 0 (no caching).
+        Returns:
+            The list of the items of ids, in the order of ids. Unknown ids are left out.
+        """
+        for item in items:
+            i = str(item.get("symbolId"))
+            found[i] = item
+            if ttl > 0:
+                self._cache_store((kind, i), item, ttl)
+        return [found[i] for i in ids if i in found]
+
+
+    def _stream_items(self, url, params=None, prefix="", what="", caller=""):
+        """
+        Description:
+            Queries an endpoint and yields the items of one of the arrays of its json response as
+            they are parsed, with ijson, so that the whole response is never held in memory.
+            Parses the response at once instead when ijson is not installed, or with an httpx client.
+        Parameters:
+            - url the endpoint to query.
+            - params optional dictionary of query parameters.
+            - prefix ijson path of the items to yield, such as "candles.item".
+            - what description of the queried data, for error messages.
+            - caller name of the calling method, for error messages.
+        Returns:
+            A generator of the Python object representations of the items.
+        """
+        if ijson is None or not isinstance(self._session, requests.Session):
+            yield from self._request("GET", url, params=params, what=what, caller=caller)[prefix.split(".")[0]]
+            return
+        try:
+            resp = self._session.get(url, params=params, stream=True, timeout=self.timeout)
+        except _REQUEST_ERRORS as ex:
+            self._report_and_exit(f"Failed to query server for {what}.", ex)
+        with resp:
+            if resp.status_code >= 400:
+                self._report_and_exit(resp.url, resp.text, f"Failed to query server for {what}.", f"{self.server_type} server returned {resp.status_code} on {caller}().")
+            # let urllib3 undo any gzip content-encoding before ijson reads the body
+            resp.raw.decode_content = True
+            yield from ijson.items(resp.raw, prefix, use_float=True)
+
+
     def _report_and_exit(self, *args):
         """
         Description:
@@ -153,16 +809,32 @@ class Trader:
             is authorized.
             You generally would never call this method, as it is called in Trader.
             To obtain your account information, call the get_accounts method.
+        Raises:
+            requests.exceptions.RequestException (or httpx.HTTPError if http2 is set) if the
+            accounts could not be retrieved, so that
+            Trader can fall back to exchanging the refresh token.
         """
-        cmd_class = "v1/accounts"
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, f"{self.server_type} server returned {resp.status_code} on get_new_refresh_token() attempt.", ex)
+        resp = self._session.get(self._base, timeout=self.timeout)
+        resp.raise_for_status()
 
-        self.userid = resp.json()["userId"]
-        self.accounts = resp.json()["accounts"] # list of accounts
+        rd = _loads(resp.content)
+        self.userid = rd["userId"]
+        self.accounts = rd["accounts"] # list of accounts
+        self._index_accounts()
+
+
+    def _index_accounts(self):
+        """
+        Description:
+            Builds the account type to account number lookup table, and the per account endpoint
+            urls, so that data-fetch methods do not rebuild them on every call.
+        """
+        self._accounts_by_type = {}
+        self._urls = {}
+        for account in self.accounts:
+            number = account["number"]
+            self._accounts_by_type.setdefault(account["type"].lower(), number)
+            self._urls[number] = {resource: f"{self._base}/{number}/{resource}" for resource in ("activities", "orders", "executions", "balances", "positions")}
 
 
     def get_accounts(self, verbose=''):
@@ -175,11 +847,12 @@ class Trader:
         Returns:
             All your Questrade accounts as a Python object representation of the returned json.
         """
-        if verbose:
-            print(f"Accounts for user id {self.userid}:")
+        verbosity, vlog = _v(verbose)
+        if verbosity > 0:
+            vlog.info("Accounts for user id %s:", self.userid)
         for account in self.accounts:
-            if verbose:
-                pprint(account)
+            if verbosity > 0:
+                _log_data(vlog, account, verbosity)
             yield account
 
 
@@ -188,6 +861,9 @@ class Trader:
         Description:
             Decorator used to circumvent the 30 day range limit imposed by Questrade for queries
             based on datetime ranges.
+            The 30 day chunks are queried concurrently (up to max_workers at a time), and yielded
+            in chronological order. A chunk that fails raises its exception, as when the chunks
+            are queried one after the other, and the chunks not started yet are cancelled.
         Parameters:
             - f function containing two datetime parameters, among others, as start datetime and
             end datetime.
@@ -196,29 +872,21 @@ class Trader:
             end datetime.
         """
         def inner(self, startdatetime, enddatetime=None, *args, **kwargs):
-            if enddatetime == None:
-                enddatetime = dt.now()
-            dlt = enddatetime - startdatetime
-            if dlt.days <= 29:
-                js = f(self, startdatetime=startdatetime, enddatetime=enddatetime, *args, **kwargs)
-                yield js
-            else:
-                thirdy_days = td(days=29)
-                idt = startdatetime + thirdy_days
-                js = f(self, startdatetime=startdatetime, enddatetime=idt, *args, **kwargs)
-                yield js
-                startdatetime = idt + td(days=1)
-                idt = startdatetime + thirdy_days
-                dlt = enddatetime - startdatetime
-                while dlt.days > 29:
-                    js = f(self, startdatetime=startdatetime, enddatetime=idt, *args, **kwargs)
-                    yield js
-                    startdatetime = idt + td(days=1)
-                    idt = startdatetime + thirdy_days
-                    dlt = enddatetime - startdatetime
-                if dlt.days >= 1:
-                    js = f(self, startdatetime=startdatetime, enddatetime=enddatetime, *args, **kwargs)
-                    yield js
+            windows = _windows(startdatetime, enddatetime)
+            if len(windows) == 1 or self.max_workers <= 1:
+                for sdt, edt in windows:
+                    yield f(self, startdatetime=sdt, enddatetime=edt, *args, **kwargs)
+                return
+            # the windows are independent: fetch them concurrently over the pooled session,
+            # and yield the results in chronological order
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(f, self, startdatetime=sdt, enddatetime=edt, *args, **kwargs) for sdt, edt in windows]
+                try:
+                    for future in futures:
+                        yield future.result()
+                finally:
+                    for future in futures:
+                        future.cancel()
         return inner
             
 
@@ -247,23 +915,17 @@ class Trader:
         sdt = self.build_datetime_string(startdatetime)
         edt = self.build_datetime_string(enddatetime)
 
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._urls[accountnumber]['activities']
         if verbosity > 2:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'activities']))
-            print(" ".join([self.token_type, self.access_token]))
-        if verbosity > 0:
-            print({'startTime': sdt, 'endTime': edt})	
+            vlog.debug("GET %s", url)
         parameters = {'startTime': sdt, 'endTime': edt}
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'activities']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account activities.", f"{self.server_type} server returned {resp.status_code} on get_account_activities().", ex)
-
+        if verbosity > 0:
+            _log_data(vlog, parameters, verbosity)
+        rd = self._request("GET", url, params=parameters, what="account activities", caller="get_account_activities")
         if verbosity > 1:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
     
 
     def values_to_dobj(self, y, m, d, h=0, mi=0, s=0):
@@ -295,15 +957,18 @@ class Trader:
         Returns:
             The provided datetime object in Questrade API compatible string format.
             Example: "2011-02-01T00:00:00-05:00".
-            If gmt is set to False, time will be in local time.
+            If gmt is set to False, time will be in local time, or in the timezone of dto if it
+            has one. The utc offset is the one in effect at that time, daylight saving included.
             If gmt is True, the returned time will be considered as gmt time.
         """
-        utcoffset = time.strftime("%z")
         if gmt:
-            dto.replace(tzinfo=tz.utc)
-            utcoffset = "+0000"
-        stxt = dto.strftime("%Y-%m-%dT%X{}:{}".format(utcoffset[:3], utcoffset[-2:]))
-        return stxt
+            if dto.tzinfo is not None:
+                dto = dto.astimezone(timezone.utc)
+            return dto.strftime("%Y-%m-%dT%H:%M:%S") + _GMT_OFFSET_FMT
+        if dto.tzinfo is None:
+            dto = dto.astimezone()
+        offset = dto.strftime("%z")
+        return dto.strftime("%Y-%m-%dT%H:%M:%S") + f"{offset[:3]}:{offset[3:5]}"
 
 
     def values_to_qdstr(self, y, m, d, h=0, mi=0, s=0, gmt=False):
@@ -357,10 +1022,7 @@ class Trader:
         Returns:
             An account number in string format.
         """
-        for account in self.accounts:
-            if accounttype.lower() == account["type"].lower():
-                return account["number"]
-        return None
+        return self._accounts_by_type.get(accounttype.lower())
 
 
     @get_all
@@ -391,30 +1053,19 @@ class Trader:
         sdt = self.build_datetime_string(startdatetime)
         edt = self.build_datetime_string(enddatetime)
 
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
 
-        if statefilter.lower().startswith("o"):
-            statefilter = "Open"
-        elif statefilter.lower().startswith("c"):
-            statefilter = "Closed"
-        else:
-            statefilter = "All"
+        statefilter = _STATEFILTER.get(statefilter[:1].lower(), "All")
+        url = self._urls[accountnumber]['orders']
         if verbosity > 2:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'orders']))
-            print(" ".join([self.token_type, self.access_token]))
+            vlog.debug("GET %s", url)
         if verbosity > 0:
-            print({'startTime': sdt, 'endTime': edt})
+            _log_data(vlog, {'startTime': sdt, 'endTime': edt}, verbosity)
         parameters = {'startTime': sdt, 'endTime': edt, 'stateFilter': statefilter}
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'orders']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account orders.", f"{self.server_type} server returned {resp.status_code} on get_account_orders().", ex)
-
+        rd = self._request("GET", url, params=parameters, what="account orders", caller="get_account_orders")
         if verbosity > 1:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
     def get_account_orders_by_ids(self, orderid, accounttype="TFSA", verbose=''):
@@ -436,21 +1087,15 @@ class Trader:
         if accountnumber == None:
             self._report_and_exit(f"Nonexistent {accounttype} account.")
             
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._urls[accountnumber]['orders']
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'orders']))
-            print(" ".join([self.token_type, self.access_token]))
+            vlog.debug("GET %s", url)
         parameters = {'ids': orderid}
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'orders']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account orders by ids.", f"{self.server_type} server returned {resp.status_code} on get_account_orders_by_ids().", ex)
-
+        rd = self._request("GET", url, params=parameters, what="account orders by ids", caller="get_account_orders_by_ids")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
     
 
     @get_all
@@ -479,26 +1124,20 @@ class Trader:
         sdt = self.build_datetime_string(startdatetime)
         edt = self.build_datetime_string(enddatetime)
 
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._urls[accountnumber]['executions']
         if verbosity > 2:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'executions']))
-            print(" ".join([self.token_type, self.access_token]))
-        if verbosity > 0:
-            print({'startTime': sdt, 'endTime': edt})
+            vlog.debug("GET %s", url)
         parameters = {'startTime': sdt, 'endTime': edt}
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'executions']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account executions.", f"{self.server_type} server returned {resp.status_code} on get_account_executions().", ex)
-
+        if verbosity > 0:
+            _log_data(vlog, parameters, verbosity)
+        rd = self._request("GET", url, params=parameters, what="account executions", caller="get_account_executions")
         if verbosity > 1:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
-    def get_account_balances(self, accounttype="TFSA", verbose=''):
+    def get_account_balances(self, accounttype="TFSA", verbose='', cache=True):
         """
         Definition:
             Provides the account balances for the account related to account type accounttype.
@@ -506,6 +1145,8 @@ class Trader:
             - accounttype type of Questrade account. Defaults to "tfsa".
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 10 seconds.
+            Defaults to True.
         Returns:
             Account balances as a Python object representation of the returned json.
         """
@@ -513,23 +1154,18 @@ class Trader:
         if accountnumber == None:
             self._report_and_exit(f"Nonexistent {accounttype} account.")
             
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._urls[accountnumber]['balances']
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'balances']))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'balances']), headers={'Authorization': " ".join([self.token_type, self.access_token])})
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account balances.", f"{self.server_type} server returned {resp.status_code} on get_account_balances().", ex)
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, ttl=_TTL["balances"] if cache else 0, what="account balances", caller="get_account_balances")
 
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
-    def get_account_positions(self, accounttype="TFSA", verbose=''):
+    def get_account_positions(self, accounttype="TFSA", verbose='', cache=True):
         """
         Definition:
             Provides the account positions for the account related to account type accounttype.
@@ -537,6 +1173,8 @@ class Trader:
             - accounttype type of Questrade account. Defaults to "tfsa".
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 10 seconds.
+            Defaults to True.
         Returns:
             Account positions as a Python object representation of the returned json.
         """
@@ -544,47 +1182,40 @@ class Trader:
         if accountnumber == None:
             self._report_and_exit(f"Nonexistent {accounttype} account.")
             
-        cmd_class = "v1/accounts"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._urls[accountnumber]['positions']
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, accountnumber, 'positions']))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, accountnumber, 'positions']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for account positions.", f"{self.server_type} server returned {resp.status_code} on get_account_positions().", ex)
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, ttl=_TTL["positions"] if cache else 0, what="account positions", caller="get_account_positions")
 
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
-    def get_server_time(self, verbose=''):
+    def get_server_time(self, verbose='', cache=True):
         """
         Description:
             Provides the time from the Questrade API server.
         Parameters:
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 1 second.
+            Defaults to True.
         Returns:
             The time on the server as a tuple made of a simple datetime object,
             as well as in the expected Python object representation of the returned json.
         """
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self.api_server}/v1/time"
         if verbosity > 1:
-            print("/".join([self.api_server, "v1/time"]))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, "v1/time"]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for its time.", f"{self.server_type} server returned {resp.status_code} on get_server_time().", ex)
-
-        rd = resp.json()
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, ttl=_TTL["time"] if cache else 0, what="its time", caller="get_server_time")
+        # "2014-10-24T12:14:42.730000-04:00": keep the date and time, without the fraction and offset
+        dto = dt.fromisoformat(rd["time"][:19])
         if verbosity > 0:
-            pprint(dt.strptime(rd["time"][:-13], '%Y-%m-%dT%X'))
-        return dt.strptime(rd["time"][:-13], '%Y-%m-%dT%X'), rd
+            _log_data(vlog, dto, verbosity)
+        return dto, rd
 
 
     @get_all
@@ -610,50 +1241,160 @@ class Trader:
         sdt = self.build_datetime_string(startdatetime)
         edt = self.build_datetime_string(enddatetime)
         
-        cmd_class = "v1/markets"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self._markets_url}/candles/{sid}"
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, "candles", str(sid)]))
-            print(" ".join([self.token_type, self.access_token]))
+            vlog.debug("GET %s", url)
         parameters = {'startTime': sdt, 'endTime': edt, "interval": interval}
+        # candles of a range that is over will not change: keep them on disk
+        key = self._candles_key(sid, interval, sdt, edt, enddatetime)
+        if key is not None:
+            rd = self._candles_lookup(key)
+            if rd is not None:
+                if verbosity > 0:
+                    _log_data(vlog, rd, verbosity)
+                return rd
+        rd = self._request("GET", url, params=parameters, what="market candles", caller="get_market_candles")
+        if key is not None:
+            self._candles_store(key, rd)
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    def iter_market_candles(self, sid, interval, startdatetime, enddatetime=None, verbose=''):
+        """
+        Description:
+            Streaming version of get_market_candles: yields the candles one at a time, parsing
+            each 30 day chunk as it is received (python -m pip install kwess[stream]), instead
+            of building every response in memory. Chunks found in candles_cache are read from it,
+            but streamed chunks are not saved to it.
+        Parameters:
+            Same as get_market_candles.
+        Returns:
+            A generator of the OHLC candlesticks for the specified symbol, as Python object
+            representations of the returned json, in chronological order.
+        """
+        verbosity, vlog = _v(verbose)
+        url = f"{self._markets_url}/candles/{sid}"
+        for start, end in _windows(startdatetime, enddatetime):
+            sdt = self.build_datetime_string(start)
+            edt = self.build_datetime_string(end)
+            if verbosity > 1:
+                vlog.debug("GET %s", url)
+            rd = None
+            key = self._candles_key(sid, interval, sdt, edt, end)
+            if key is not None:
+                rd = self._candles_lookup(key)
+            if rd is not None:
+                candles = rd["candles"]
+            else:
+                parameters = {'startTime': sdt, 'endTime': edt, "interval": interval}
+                candles = self._stream_items(url, params=parameters, prefix="candles.item", what="market candles", caller="iter_market_candles")
+            for candle in candles:
+                if verbosity > 0:
+                    _log_data(vlog, candle, verbosity)
+                yield candle
+
+
+    def map_market_candles(self, sids, interval, startdatetime, enddatetime=None, workers=16, verbose=''):
+        """
+        Description:
+            Provides the market candles of several symbols, queried from a pool of threads.
+            This is the synchronous alternative to AsyncTrader's concurrent queries.
+        Parameters:
+            - sids list of symbol ids.
+            - workers maximum number of concurrent requests, up to the size of the connection pool.
+            Defaults to 16.
+            - other parameters same as get_market_candles.
+        Returns:
+            A list holding, for each symbol id of sids in order, the list of results of
+            get_market_candles (one per chunk of 30 days).
+        """
+        windows = _windows(startdatetime, enddatetime)
+        # the 30 day chunks of all the symbols share one pool, rather than one pool per symbol
+        def candles(query):
+            sid, (sdt, edt) = query
+            return next(self.get_market_candles(sid=sid, interval=interval, startdatetime=sdt, enddatetime=edt, verbose=verbose))
+        results = self._map(candles, [(sid, window) for sid in sids for window in windows], workers)
+        return [results[i:i + len(windows)] for i in range(0, len(results), len(windows))]
+
+
+    def _candles_key(self, sid, interval, sdt, edt, enddatetime):
+        """
+        Description:
+            Builds the candles_cache key of a range of market candles of the server type, if that
+            range is over.
+        Parameters:
+            - sid symbol id as a string or numeral.
+            - interval Historical Data Granularity.
+            - sdt, edt start and end of the range as Questrade datetime strings.
+            - enddatetime end of the range as a datetime object, naive or timezone aware, or None
+            for now.
+        Returns:
+            A string key, or None if candles_cache is not set or if the range ended less than
+            5 minutes ago.
+        """
+        if not self.candles_cache or enddatetime is None or enddatetime >= dt.now(enddatetime.tzinfo) - td(minutes=5):
+            return None
+        # one file serves both the live and the practice server
+        return "|".join([self.server_type, str(sid), interval, sdt, edt])
+
+
+    def _candles_lookup(self, key):
+        """
+        Description:
+            Looks up market candles in the local candles_cache file.
+        Parameters:
+            - key string built by _candles_key.
+        Returns:
+            The cached Python object representation of the json, or None if not found.
+        """
         try:
-            resp = requests.get("/".join([self.api_server, cmd_class, "candles", str(sid)]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for market candles.", f"{self.server_type} server returned {resp.status_code} on get_market_candles().", ex)
+            with self._candles_lock, shelve.open(self.candles_cache) as db:
+                return db.get(key)
+        except dbm.error:
+            return None
 
-        if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+
+    def _candles_store(self, key, rd):
+        """
+        Description:
+            Saves market candles in the local candles_cache file.
+        Parameters:
+            - key string built by _candles_key.
+            - rd Python object representation of the returned json.
+        """
+        try:
+            with self._candles_lock, shelve.open(self.candles_cache) as db:
+                db[key] = rd
+        except dbm.error as ex:
+            print(f"Could not save market candles in file {self.candles_cache}:")
+            print(ex)
             
 
-    def get_market_quotes_strategies(self, variants, verbose=''):
+    def get_market_quotes_strategies(self, variants, verbose='', cache=True):
         """
         Definition:
             Provides a calculated L1 market data quote for a single or many multi-leg strategies.
         Parameter:
-            - variants is a list of dictionary items.
+            - variants is a list of dictionary items, sent as a json body, as documented by Questrade.
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 1 second.
+            Defaults to True.
         Returns:
             A calculated L1 market data quote for a single or many multi-leg strategies
             as a Python object representation of the returned json.
         """
-        cmd_class = "v1/markets"
-        parameters = {"variants": variants}
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self._markets_url}/quotes/strategies"
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, "quotes/strategies"]))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, "quotes/strategies"]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for market quote strategies.", f"{self.server_type} server returned {resp.status_code} on get_market_quotes_strategies().", ex)
-
+            vlog.debug("POST %s", url)
+        rd = self._request("POST", url, json_body={"variants": variants}, ttl=_TTL["quotes"] if cache else 0, what="market quote strategies", caller="get_market_quotes_strategies")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
     def get_market_quotes_options(self, option_ids, filters=None, verbose=''):
@@ -669,33 +1410,30 @@ class Trader:
             A single Level 1 market data quote and Greek data for one or more option symbols
             as a Python object representation of the returned json.
         """
-        cmd_class = "v1/markets"
         parameters = {"optionIds": option_ids}
         if filters:
             parameters["filters"] = filters
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self._markets_url}/quotes/options"
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, "quotes/options"]))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.post("/".join([self.api_server, cmd_class, "quotes/options"]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, json=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for market quote options.", f"{self.server_type} server returned {resp.status_code} on get_market_quotes_options().", ex)
-
+            vlog.debug("POST %s", url)
+        rd = self._request("POST", url, json_body=parameters, what="market quote options", caller="get_market_quotes_options")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
             
             
-    def get_market_quotes(self, ids, verbose=''):
+    def get_market_quotes(self, ids, verbose='', cache=True):
         """
         Definition:
             Provides market quotes data.
         Parameter:
-            - ids Internal symbol identifier. Could be a single value or a string of values.
+            - ids Internal symbol identifier. Could be a single value, a list or tuple of values, or
+            a string of comma separated values.
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 1 second.
+            Defaults to True.
         Returns:
             A single Level 1 market data quote for one or more symbols in json string format
             as a Python object representation of the returned json.
@@ -705,62 +1443,84 @@ class Trader:
             once limit is reached, the response will return delayed data.
             (Please check "delay" parameter in response always).
         """
-        ids = str(ids)
-        cmd_class = "v1/markets"
-        parameters = {}
-        resp = None
-        verbosity = len(verbose)
-        try:
-            if type(ids) is str and "," in ids:
-                parameters['ids'] = ids
-                if verbosity > 1:
-                    print("/".join([self.api_server, cmd_class, "quotes"]))
-                    print(" ".join([self.token_type, self.access_token]))
-                resp = requests.get("/".join([self.api_server, cmd_class, "quotes"]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            elif ids: # single id
-                if verbosity > 1:
-                    print("/".join([self.api_server, cmd_class, "quotes", ids]))
-                    print(" ".join([self.token_type, self.access_token]))
-                resp = requests.get("/".join([self.api_server, cmd_class, "quotes", ids]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            else:
-                self._report_and_exit("Invalid parameter(s) for get_market_quotes.")
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for market quotes.", f"{self.server_type} server returned {resp.status_code} on get_market_quotes().", ex)
-
+        verbosity, vlog = _v(verbose)
+        url, parameters = _ids_query(f"{self._markets_url}/quotes", ids)
+        if url is None:
+            self._report_and_exit("Invalid parameter(s) for get_market_quotes.")
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, params=parameters, ttl=_TTL["quotes"] if cache else 0, what="market quotes", caller="get_market_quotes")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    def get_market_quotes_bulk(self, ids, chunk=100, verbose='', cache=True):
+        """
+        Definition:
+            Provides market quotes data for many symbols, using as few multi-id requests as possible.
+            Prefer this over calling get_market_quotes once per id, which is kept for single lookups.
+        Parameter:
+            - ids list of internal symbol identifiers, or a string of comma separated values.
+            - chunk maximum number of ids per request. Defaults to 100.
+            - verbose level of verbosity represented by the number of characters in a string.
+            Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 1 second.
+            Defaults to True.
+        Returns:
+            A dictionary with a single "quotes" key holding the quotes of all requested ids, in the
+            order they were requested. Only the ids whose quote is not cached are queried.
+        """
+        ids, found, missing = self._bulk_lookup("quote", ids, cache)
+        quotes = []
+        for batch in _chunks(missing, chunk):
+            quotes.extend(self.get_market_quotes(batch, verbose, cache)["quotes"])
+        return {"quotes": self._bulk_merge("quote", ids, found, quotes, _TTL["quotes"] if cache else 0)}
+
+
+    def map_market_quotes(self, ids_list, workers=16, verbose='', cache=True):
+        """
+        Definition:
+            Provides market quotes data for several values accepted by get_market_quotes, queried
+            from a pool of threads. This is the synchronous alternative to
+            AsyncTrader.gather_market_quotes.
+        Parameter:
+            - ids_list list of values accepted by get_market_quotes, such as strings of comma
+            separated ids.
+            - workers maximum number of concurrent requests, up to the size of the connection pool.
+            Defaults to 16.
+            - verbose, cache same as get_market_quotes.
+        Returns:
+            A list of the Python object representations of the returned json, in the order of
+            ids_list.
+        """
+        return self._map(lambda ids: self.get_market_quotes(ids, verbose, cache), ids_list, workers)
     
 
-    def get_markets(self, verbose=''):
+    def get_markets(self, verbose='', cache=True):
         """
         Description:
             Provides market data.
         Parameters:
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for a day.
+            Defaults to True. An expired response is reused if the server reports it unchanged.
         Return:
             Information about supported markets as a Python object representation
             of the returned json.
         """
-        cmd_class = "v1/markets"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = self._markets_url
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class]))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for markets.", f"{self.server_type} server returned {resp.status_code} on get_markets().", ex)
-
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, ttl=_TTL["markets"] if cache else 0, what="markets", caller="get_markets", revalidate=True)
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
     
 
-    def get_symbol_options(self, sid, verbose=''):
+    def get_symbol_options(self, sid, verbose='', cache=True):
         """
         Definition:
             Provides symbol options data.
@@ -768,27 +1528,47 @@ class Trader:
             - sid Internal symbol identifier.
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for an hour.
+            Defaults to True. An expired response is reused if the server reports it unchanged.
         Returns:
             An option chain for a particular underlying symbol as a Python object representation
             of the returned json.
         """
-        cmd_class = "v1/symbols"
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self._symbols_url}/{sid}/options"
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, str(sid), "options"]))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, str(sid), "options"]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for symbol options.", f"{self.server_type} server returned {resp.status_code} on get_symbol_options().", ex)
-
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, ttl=_TTL["symbols"] if cache else 0, what="symbol options", caller="get_symbol_options", revalidate=True)
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    def iter_symbol_options(self, sid, verbose=''):
+        """
+        Definition:
+            Streaming version of get_symbol_options: yields the option chain one expiry date at a
+            time, as it is parsed (python -m pip install kwess[stream]), instead of building the
+            whole response in memory. The response is not cached.
+        Parameter:
+            - sid Internal symbol identifier.
+            - verbose level of verbosity represented by the number of characters in a string.
+            Defaults to empty string. Maximum verbosity is 2 or "vv".
+        Returns:
+            A generator of the option chain entries of a particular underlying symbol, as Python
+            object representations of the returned json.
+        """
+        verbosity, vlog = _v(verbose)
+        url = f"{self._symbols_url}/{sid}/options"
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        for entry in self._stream_items(url, prefix="optionChain.item", what="symbol options", caller="iter_symbol_options"):
+            if verbosity > 0:
+                _log_data(vlog, entry, verbosity)
+            yield entry
             
 
-    def search_symbols(self, prefix, offset=0, verbose=''):
+    def search_symbols(self, prefix, offset=0, verbose='', cache=True):
         """
         Definition:
             Provides symbol(s) data using several search criteria.
@@ -798,68 +1578,91 @@ class Trader:
             Default is not to offset.
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for an hour.
+            Defaults to True. An expired response is reused if the server reports it unchanged.
         Returns:
             Symbol(s) data as a Python object representation of the returned json.
         """
-        cmd_class = "v1/symbols"
         parameters = {"prefix": prefix, "offset": offset}
-        verbosity = len(verbose)
+        verbosity, vlog = _v(verbose)
+        url = f"{self._symbols_url}/search"
         if verbosity > 1:
-            print("/".join([self.api_server, cmd_class, 'search']))
-            print(" ".join([self.token_type, self.access_token]))
-        try:
-            resp = requests.get("/".join([self.api_server, cmd_class, 'search']), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to search server for symbols.", f"{self.server_type} server returned {resp.status_code} on search_symbols().", ex)
-
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, params=parameters, ttl=_TTL["symbols"] if cache else 0, what="symbols", caller="search_symbols", revalidate=True)
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
 
 
-    def get_symbols_by_ids(self, ids, verbose=''):
+    def get_symbols_by_ids(self, ids, verbose='', cache=True):
         """
         Definition:
             Provides symbols data from symbol id(s).
         Parameter:
-            - ids Internal symbol identifier(s). Could be a single numeric value or a string of
-            comma-seperated values (with no spaces).
+            - ids Internal symbol identifier(s). Could be a single numeric value, a list or tuple
+            of values, or a string of comma-seperated values (with no spaces).
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for an hour.
+            Defaults to True.
         Returns:
             Detailed information about one or more symbol as a Python object representation
             of the returned json.
         """
-        ids = str(ids)
-        cmd_class = "v1/symbols"
-        parameters = {}
-        resp = None
-        verbosity = len(verbose)
-        try:
-            if type(ids) is str and "," in ids:
-                parameters['ids'] = ids
-                if verbosity > 1:
-                    print("/".join([self.api_server, cmd_class]))
-                    print(" ".join([self.token_type, self.access_token]))
-                resp = requests.get("/".join([self.api_server, cmd_class]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
-            elif ids: # single id
-                if verbosity > 1:
-                    print("/".join([self.api_server, cmd_class, ids]))
-                    print(" ".join([self.token_type, self.access_token]))
-                resp = requests.get("/".join([self.api_server, cmd_class, ids]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, timeout=self.timeout)
-            else:
-                self._report_and_exit("Invalid parameter(s) for get_symbols_by_ids.")
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for symbols by ids.", f"{self.server_type} server returned {resp.status_code} on get_symbols_by_ids().", ex)
-
+        verbosity, vlog = _v(verbose)
+        url, parameters = _ids_query(self._symbols_url, ids)
+        if url is None:
+            self._report_and_exit("Invalid parameter(s) for get_symbols_by_ids.")
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, params=parameters, ttl=_TTL["symbols"] if cache else 0, what="symbols by ids", caller="get_symbols_by_ids")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    def get_symbols_by_ids_bulk(self, ids, chunk=100, verbose='', cache=True):
+        """
+        Definition:
+            Provides symbols data for many symbol ids, using as few multi-id requests as possible.
+            Prefer this over calling get_symbols_by_ids once per id, which is kept for single lookups.
+        Parameter:
+            - ids list of internal symbol identifiers, or a string of comma separated values.
+            - chunk maximum number of ids per request. Defaults to 100.
+            - verbose level of verbosity represented by the number of characters in a string.
+            Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for an hour.
+            Defaults to True.
+        Returns:
+            A dictionary with a single "symbols" key holding the symbols of all requested ids, in
+            the order they were requested. Only the ids whose symbol is not cached are queried.
+        """
+        ids, found, missing = self._bulk_lookup("symbol", ids, cache)
+        symbols = []
+        for batch in _chunks(missing, chunk):
+            symbols.extend(self.get_symbols_by_ids(batch, verbose, cache)["symbols"])
+        return {"symbols": self._bulk_merge("symbol", ids, found, symbols, _TTL["symbols"] if cache else 0)}
 
 
-    def get_symbols_by_names(self, names, verbose=''):
+    def map_symbols_by_ids(self, ids_list, workers=16, verbose='', cache=True):
+        """
+        Definition:
+            Provides symbols data for several values accepted by get_symbols_by_ids, queried from
+            a pool of threads.
+        Parameter:
+            - ids_list list of values accepted by get_symbols_by_ids, such as strings of comma
+            separated ids.
+            - workers maximum number of concurrent requests, up to the size of the connection pool.
+            Defaults to 16.
+            - verbose, cache same as get_symbols_by_ids.
+        Returns:
+            A list of the Python object representations of the returned json, in the order of
+            ids_list.
+        """
+        return self._map(lambda ids: self.get_symbols_by_ids(ids, verbose, cache), ids_list, workers)
+
+
+    def get_symbols_by_names(self, names, verbose='', cache=True):
         """
         Definition:
             Provides symbols data from name(s).
@@ -867,28 +1670,487 @@ class Trader:
             - names is a string of names seperated by commas (with no spaces).
             - verbose level of verbosity represented by the number of characters in a string.
             Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for an hour.
+            Defaults to True.
         Returns:
             Detailed information about one or more symbol as a Python object representation
             of the returned json.
         """
-        cmd_class = "v1/symbols"
-        parameters = {}
-        resp = None
-        verbosity = len(verbose)
-        try:
-            if names:
-                parameters['names'] = names
-                if verbosity > 1:
-                    print("/".join([self.api_server, cmd_class]))
-                    print(" ".join([self.token_type, self.access_token]))
-                resp = requests.get("/".join([self.api_server, cmd_class]), headers={'Authorization': " ".join([self.token_type, self.access_token])}, params=parameters, timeout=self.timeout)
+        if not names:
+            self._report_and_exit("Invalid parameter(s) for get_symbols_by_names.")
+        verbosity, vlog = _v(verbose)
+        url = self._symbols_url
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = self._request("GET", url, params={'names': names}, ttl=_TTL["symbols"] if cache else 0, what="symbols by names", caller="get_symbols_by_names")
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+
+class AsyncTrader(Trader):
+    def __init__(self, rt_file="refreshToken", server_type="live", timeout=15, max_workers=8, candles_cache="~/.kwess_cache", http2=False, verbose=''):
+        """
+        Description:
+            Initializer of an AsyncTrader object: a Trader whose market and symbol methods are
+            coroutines, built on aiohttp, so that many of them can run concurrently
+            (with asyncio.gather for instance). Tokens and accounts are handled as in Trader,
+            and the account methods are the same as Trader's.
+            With http2=True, the coroutines are built on httpx instead, and share a few
+            multiplexed HTTP/2 connections.
+            Use it as an asynchronous context manager:
+                async with kwess.AsyncTrader(rt_file="my_token.txt") as aqs:
+                    quotes = await aqs.gather_market_quotes([12890, 26070347])
+            or call its close method when done.
+        Parameters:
+            Same as Trader. Requires aiohttp, or httpx[http2] with http2=True.
+        Returns:
+            AsyncTrader object.
+        """
+        # before Trader queries the accounts, and possibly exchanges the refresh token
+        if not http2 and aiohttp is None:
+            self._report_and_exit("AsyncTrader requires aiohttp: python -m pip install kwess[async]")
+        self._client = None
+        self._ainflight = {} # request key -> (event set once answered, [json]) of cacheable requests on their way
+        super().__init__(rt_file, server_type, timeout, max_workers, candles_cache, http2, verbose)
+
+
+    async def __aenter__(self):
+        self._get_client()
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    async def close(self):
+        """
+        Description:
+            Closes the aiohttp session (or httpx client), if any.
+        """
+        if self._client is not None:
+            if self.http2:
+                await self._client.aclose()
             else:
-                self._report_and_exit("Invalid parameter(s) for get_symbols_by_names.")
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as ex:
-            self._report_and_exit(resp.request.url, resp.text, "Failed to query server for symbols by names.", f"{self.server_type} server returned {resp.status_code} on get_symbols_by_names().", ex)
+                await self._client.close()
+            self._client = None
+
+
+    def _set_authorization(self):
+        """
+        Description:
+            Same as Trader._set_authorization, and also updates the aiohttp session (or httpx
+            client) if it exists.
+        """
+        super()._set_authorization()
+        if getattr(self, "_client", None) is not None:
+            self._client.headers["Authorization"] = self._auth_header
+
+
+    def _get_client(self):
+        """
+        Description:
+            Creates the aiohttp session (or httpx client with http2) on first use, since it must
+            be created within the event loop.
+        Returns:
+            The aiohttp session or httpx client.
+        """
+        if self._client is None:
+            headers = {'Authorization': self._auth_header}
+            if self.http2:
+                # a few multiplexed connections carry all the concurrent requests
+                self._client = httpx.AsyncClient(http2=True, headers=headers, timeout=self.timeout, limits=httpx.Limits(max_connections=4, max_keepalive_connections=4))
+            else:
+                self._client = aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._client
+
+
+    async def _afetch(self, method, url, params=None, body=None, headers=None):
+        """
+        Description:
+            Sends one request with the aiohttp session or httpx client.
+        Parameters:
+            - method "GET" or "POST".
+            - url the endpoint to query.
+            - params optional dictionary of query parameters.
+            - body optional json body as bytes.
+            - headers optional dictionary of extra request headers.
+        Returns:
+            A (status, content, headers, url) tuple of the response.
+        """
+        if self.http2:
+            resp = await self._get_client().request(method, url, params=params, content=body, headers=headers)
+            return resp.status_code, resp.content, resp.headers, str(resp.url)
+        async with self._get_client().request(method, url, params=params, data=body, headers=headers) as resp:
+            return resp.status, await resp.read(), resp.headers, str(resp.url)
+
+
+    async def _arequest(self, method, url, params=None, json_body=None, ttl=0, what="", caller="", revalidate=False):
+        """
+        Description:
+            Sends one asynchronous request to the api server, unless the same request was answered
+            less than ttl seconds ago. A request that cannot reach the server, or that is throttled
+            or fails on the server side, is sent again twice.
+        Parameters:
+            - method "GET" or "POST".
+            - url the endpoint to query.
+            - params optional dictionary of query parameters.
+            - json_body optional Python object sent as json body.
+            - ttl number of seconds a response stays valid. Defaults to 0 (no caching).
+            - what description of the queried data, used in the failure message.
+            - caller name of the calling method, used in the failure message.
+            - revalidate same as in Trader._request.
+        Returns:
+            The Python object representation of the returned json.
+        """
+        if ttl <= 0:
+            return await self._asend(method, url, params, json_body, what=what, caller=caller)
+        key = self._cache_key(url, params if json_body is None else json_body)
+        rd = self._cache_lookup(key)
+        if rd is not None:
+            return rd
+        flight = self._ainflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._ainflight[key] = (asyncio.Event(), [])
+        event, answer = flight
+        if not leader:
+            # the same request is already on its way (from another task): wait for its answer
+            await event.wait()
+            if answer:
+                return answer[0]
+        try:
+            rd = await self._asend(method, url, params, json_body, ttl, key, what, caller, revalidate)
+            answer.append(rd)
+            return rd
+        finally:
+            if leader:
+                del self._ainflight[key]
+                event.set()
+
+
+    async def _asend(self, method, url, params=None, json_body=None, ttl=0, key=None, what="", caller="", revalidate=False):
+        """
+        Description:
+            Sends a request for _arequest, and caches its response under key for ttl seconds.
+        Parameters:
+            - key cache key built by _cache_key, if ttl is set.
+            - other parameters same as _arequest.
+        Returns:
+            The Python object representation of the returned json.
+        """
+        stale, headers = None, None
+        if ttl > 0 and revalidate:
+            stale, headers = self._cache_stale(key)
+        body = None
+        if json_body is not None:
+            body = _dumps(json_body, indent=False)
+            headers = {**(headers or {}), 'Content-Type': "application/json"}
+        if self.http2:
+            connection_errors, request_errors = (httpx.NetworkError,), (httpx.HTTPError,)
+        else:
+            connection_errors, request_errors = (aiohttp.ClientConnectionError,), (aiohttp.ClientError, asyncio.TimeoutError)
+        # neither aiohttp nor httpx retry: do as Trader._retrying does
+        for attempt in range(_CONNECTION_RETRIES + 1):
+            try:
+                status, content, resp_headers, resp_url = await self._afetch(method, url, params, body, headers)
+            except connection_errors as ex:
+                if attempt == _CONNECTION_RETRIES:
+                    self._report_and_exit(f"Failed to query server for {what}.", ex)
+                log.debug("Retrying %s %s: %s", method, url, ex)
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+            except request_errors as ex:
+                self._report_and_exit(f"Failed to query server for {what}.", ex)
+            validators = _validators(resp_headers)
+            if status not in _RETRY_STATUS or attempt == _CONNECTION_RETRIES:
+                break
+            log.debug("Retrying %s %s: server returned %s", method, url, status)
+            await asyncio.sleep(_retry_delay(attempt, resp_headers))
+        if status >= 400:
+            self._report_and_exit(resp_url, content.decode("utf-8", errors="replace"), f"Failed to query server for {what}.", f"{self.server_type} server returned {status} on {caller}().")
+        if status == 304 and stale is not None:
+            self._cache_store(key, stale, ttl, headers)
+            return stale
+        rd = _loads(content)
+        if ttl > 0:
+            self._cache_store(key, rd, ttl, validators if revalidate else None)
+        return rd
+
+
+    async def get_market_candles(self, sid, interval, startdatetime, enddatetime=None, verbose=''):
+        """
+        Description:
+            Coroutine version of Trader.get_market_candles. The 30 day chunks are queried
+            concurrently.
+        Parameters:
+            Same as Trader.get_market_candles.
+        Returns:
+            A list of the Python object representations of the returned json, one per chunk of
+            30 days, in chronological order.
+        """
+        return await asyncio.gather(*[self._get_market_candles(sid, interval, sdt, edt, verbose) for sdt, edt in _windows(startdatetime, enddatetime)])
+
+
+    async def map_market_candles(self, sids, interval, startdatetime, enddatetime=None, workers=16, verbose=''):
+        """
+        Description:
+            Coroutine version of Trader.map_market_candles. workers is ignored: all the queries
+            run concurrently.
+        """
+        return await asyncio.gather(*[self.get_market_candles(sid, interval, startdatetime, enddatetime, verbose) for sid in sids])
+
+
+    async def _get_market_candles(self, sid, interval, startdatetime, enddatetime, verbose=''):
+        """
+        Description:
+            Queries the market candles of a range that fits the 30 day range limit.
+        """
+        sdt = self.build_datetime_string(startdatetime)
+        edt = self.build_datetime_string(enddatetime)
+        url = f"{self._markets_url}/candles/{sid}"
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        parameters = {'startTime': sdt, 'endTime': edt, "interval": interval}
+        # candles of a range that is over will not change: keep them on disk
+        key = self._candles_key(sid, interval, sdt, edt, enddatetime)
+        if key is not None:
+            rd = self._candles_lookup(key)
+            if rd is not None:
+                if verbosity > 0:
+                    _log_data(vlog, rd, verbosity)
+                return rd
+        rd = await self._arequest("GET", url, params=parameters, what="market candles", caller="get_market_candles")
+        if key is not None:
+            self._candles_store(key, rd)
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_market_quotes_strategies(self, variants, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_market_quotes_strategies.
+        Parameters:
+            Same as Trader.get_market_quotes_strategies.
+        Returns:
+            Same as Trader.get_market_quotes_strategies.
+        """
+        url = f"{self._markets_url}/quotes/strategies"
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("POST %s", url)
+        rd = await self._arequest("POST", url, json_body={"variants": variants}, ttl=_TTL["quotes"] if cache else 0, what="market quote strategies", caller="get_market_quotes_strategies")
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_market_quotes_options(self, option_ids, filters=None, verbose=''):
+        """
+        Description:
+            Coroutine version of Trader.get_market_quotes_options.
+        Parameters:
+            Same as Trader.get_market_quotes_options.
+        Returns:
+            Same as Trader.get_market_quotes_options.
+        """
+        url = f"{self._markets_url}/quotes/options"
+        parameters = {"optionIds": option_ids}
+        if filters:
+            parameters["filters"] = filters
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("POST %s", url)
+        rd = await self._arequest("POST", url, json_body=parameters, what="market quote options", caller="get_market_quotes_options")
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_market_quotes(self, ids, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_market_quotes.
+        Parameters:
+            Same as Trader.get_market_quotes.
+        Returns:
+            Same as Trader.get_market_quotes.
+        """
+        url, parameters = _ids_query(f"{self._markets_url}/quotes", ids)
+        if url is None:
+            self._report_and_exit("Invalid parameter(s) for get_market_quotes.")
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, params=parameters, ttl=_TTL["quotes"] if cache else 0, what="market quotes", caller="get_market_quotes")
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_market_quotes_bulk(self, ids, chunk=100, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_market_quotes_bulk. The chunks are queried concurrently.
+        Parameters:
+            Same as Trader.get_market_quotes_bulk.
+        Returns:
+            Same as Trader.get_market_quotes_bulk.
+        """
+        ids, found, missing = self._bulk_lookup("quote", ids, cache)
+        results = await asyncio.gather(*[self.get_market_quotes(batch, verbose, cache) for batch in _chunks(missing, chunk)])
+        return {"quotes": self._bulk_merge("quote", ids, found, [q for rd in results for q in rd["quotes"]], _TTL["quotes"] if cache else 0)}
+
+
+    async def gather_market_quotes(self, ids_list, verbose='', cache=True):
+        """
+        Description:
+            Queries the market quotes of several ids (or strings of comma separated ids) concurrently.
+        Parameters:
+            - ids_list list of values accepted by get_market_quotes.
+            - verbose level of verbosity represented by the number of characters in a string.
+            Defaults to empty string. Maximum verbosity is 2 or "vv".
+            - cache optional boolean. Set cache to False to bypass the responses kept for 1 second.
+            Defaults to True.
+        Returns:
+            A list of the Python object representations of the returned json, in the order of
+            ids_list.
+        """
+        return await asyncio.gather(*[self.get_market_quotes(ids, verbose, cache) for ids in ids_list])
+
+
+    async def map_market_quotes(self, ids_list, workers=16, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.map_market_quotes, same as gather_market_quotes.
+            workers is ignored: all the queries run concurrently.
+        """
+        return await self.gather_market_quotes(ids_list, verbose, cache)
+
+
+    async def get_markets(self, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_markets.
+        Parameters:
+            Same as Trader.get_markets.
+        Returns:
+            Same as Trader.get_markets.
+        """
+        url = f"{self._markets_url}"
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, ttl=_TTL["markets"] if cache else 0, what="markets", caller="get_markets", revalidate=True)
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_symbol_options(self, sid, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_symbol_options.
+        Parameters:
+            Same as Trader.get_symbol_options.
+        Returns:
+            Same as Trader.get_symbol_options.
+        """
+        url = f"{self._symbols_url}/{sid}/options"
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, ttl=_TTL["symbols"] if cache else 0, what="symbol options", caller="get_symbol_options", revalidate=True)
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def search_symbols(self, prefix, offset=0, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.search_symbols.
+        Parameters:
+            Same as Trader.search_symbols.
+        Returns:
+            Same as Trader.search_symbols.
+        """
+        url = f"{self._symbols_url}/search"
+        parameters = {"prefix": prefix, "offset": offset}
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, params=parameters, ttl=_TTL["symbols"] if cache else 0, what="symbols", caller="search_symbols", revalidate=True)
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
+
 
+    async def get_symbols_by_ids(self, ids, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_symbols_by_ids.
+        Parameters:
+            Same as Trader.get_symbols_by_ids.
+        Returns:
+            Same as Trader.get_symbols_by_ids.
+        """
+        url, parameters = _ids_query(self._symbols_url, ids)
+        if url is None:
+            self._report_and_exit("Invalid parameter(s) for get_symbols_by_ids.")
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, params=parameters, ttl=_TTL["symbols"] if cache else 0, what="symbols by ids", caller="get_symbols_by_ids")
         if verbosity > 0:
-            pprint(resp.json())
-        return resp.json()
+            _log_data(vlog, rd, verbosity)
+        return rd
+
+
+    async def get_symbols_by_ids_bulk(self, ids, chunk=100, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_symbols_by_ids_bulk. The chunks are queried concurrently.
+        Parameters:
+            Same as Trader.get_symbols_by_ids_bulk.
+        Returns:
+            Same as Trader.get_symbols_by_ids_bulk.
+        """
+        ids, found, missing = self._bulk_lookup("symbol", ids, cache)
+        results = await asyncio.gather(*[self.get_symbols_by_ids(batch, verbose, cache) for batch in _chunks(missing, chunk)])
+        return {"symbols": self._bulk_merge("symbol", ids, found, [sym for rd in results for sym in rd["symbols"]], _TTL["symbols"] if cache else 0)}
 
+
+    async def map_symbols_by_ids(self, ids_list, workers=16, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.map_symbols_by_ids. workers is ignored: all the queries
+            run concurrently.
+        """
+        return await asyncio.gather(*[self.get_symbols_by_ids(ids, verbose, cache) for ids in ids_list])
+
+
+    async def get_symbols_by_names(self, names, verbose='', cache=True):
+        """
+        Description:
+            Coroutine version of Trader.get_symbols_by_names.
+        Parameters:
+            Same as Trader.get_symbols_by_names.
+        Returns:
+            Same as Trader.get_symbols_by_names.
+        """
+        if not names:
+            self._report_and_exit("Invalid parameter(s) for get_symbols_by_names.")
+        url = f"{self._symbols_url}"
+        verbosity, vlog = _v(verbose)
+        if verbosity > 1:
+            vlog.debug("GET %s", url)
+        rd = await self._arequest("GET", url, params={'names': names}, ttl=_TTL["symbols"] if cache else 0, what="symbols by names", caller="get_symbols_by_names")
+        if verbosity > 0:
+            _log_data(vlog, rd, verbosity)
+        return rd
@@ -0,0 +1,223 @@
+"""
+Checks of the response cache: single-flight requests and bulk lookups, over stubbed http clients.
+Run with: python -m unittest discover -s tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+from requests.models import Response
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kwess
+
+
+API = "https://api01.iq.questrade.com"
+
+
+def _body(method, url, params):
+    """Answers like the quotes and symbols endpoints: one item per queried id."""
+    if params and "ids" in params:
+        ids = params["ids"].split(",")
+    else:
+        ids = [url.rsplit("/", 1)[1]]
+    kind = "symbols" if "/v1/symbols" in url else "quotes"
+    return {kind: [{"symbolId": int(i)} for i in ids if i != "404"]}
+
+
+class StubSession(requests.Session):
+    """A requests session that answers from _body, after an optional wait or failure."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = 0
+
+    def request(self, method, url, params=None, **kwargs):
+        with self.lock:
+            self.calls.append((method, url, params))
+            fail = self.fail > 0
+            self.fail -= 1
+        self.release.wait(5)
+        if fail:
+            raise RuntimeError("leader failed")
+        resp = Response()
+        resp.status_code = 200
+        resp.url = url
+        resp._content = json.dumps(_body(method, url, params)).encode("utf-8")
+        return resp
+
+
+def _make(cls):
+    """Builds a Trader (or AsyncTrader) from a saved access token, without querying any server."""
+    with open("accessToken.json", "wb") as fp:
+        fp.write(kwess._dumps({"access_token": "AT", "token_type": "Bearer", "api_server": f"{API}/", "refresh_token": "RT", "expires_in": 1800, "expiry_date": "", "expiry_epoch": time.time() + 1800}))
+
+    def accounts(self):
+        self.userid = 1
+        self.accounts = [{"type": "TFSA", "number": "111"}]
+        self._index_accounts()
+
+    with mock.patch.object(kwess.Trader, "_get_accounts", accounts):
+        return cls(rt_file="rt", candles_cache=None)
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+
+class SingleFlightTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.q = _make(kwess.Trader)
+        self.q._session = self.stub = StubSession()
+
+    def _run(self, n):
+        results, errors = [None] * n, []
+
+        def call(i):
+            try:
+                results[i] = self.q.get_market_quotes("1,2")
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        time.sleep(0.2)
+        self.stub.release.set()
+        for t in threads:
+            t.join(5)
+        return results, errors
+
+    def test_threads_share_one_request(self):
+        self.stub.release.clear()
+        results, errors = self._run(8)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertTrue(all(rd is results[0] for rd in results))
+        self.assertEqual(results[0], {"quotes": [{"symbolId": 1}, {"symbolId": 2}]})
+        self.assertEqual(self.q._inflight, {})
+
+    def test_follower_sends_request_when_leader_fails(self):
+        self.stub.release.clear()
+        self.stub.fail = 1
+        results, errors = self._run(2)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(self.stub.calls), 2)
+        self.assertIn({"quotes": [{"symbolId": 1}, {"symbolId": 2}]}, results)
+        self.assertEqual(self.q._inflight, {})
+
+    def test_uncached_requests_are_not_shared(self):
+        self.q.get_market_quotes("1,2", cache=False)
+        self.q.get_market_quotes("1,2", cache=False)
+        self.assertEqual(len(self.stub.calls), 2)
+
+
+class AsyncSingleFlightTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.q = _make(kwess.AsyncTrader)
+        self.calls = []
+        self.fail = 0
+
+        async def afetch(method, url, params=None, body=None, headers=None):
+            self.calls.append((method, url, params))
+            fail, self.fail = self.fail > 0, self.fail - 1
+            await asyncio.sleep(0.05)
+            if fail:
+                raise RuntimeError("leader failed")
+            return 200, json.dumps(_body(method, url, params)).encode("utf-8"), {}, url
+
+        self.q._afetch = afetch
+
+    def test_tasks_share_one_request(self):
+        async def run():
+            return await asyncio.gather(*[self.q.get_market_quotes("1,2") for _ in range(8)])
+
+        results = asyncio.run(run())
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(rd is results[0] for rd in results))
+        self.assertEqual(self.q._ainflight, {})
+
+    def test_follower_sends_request_when_leader_fails(self):
+        self.fail = 1
+
+        async def run():
+            return await asyncio.gather(self.q.get_market_quotes("1,2"), self.q.get_market_quotes("1,2"), return_exceptions=True)
+
+        leader, follower = asyncio.run(run())
+        self.assertIsInstance(leader, RuntimeError)
+        self.assertEqual(follower, {"quotes": [{"symbolId": 1}, {"symbolId": 2}]})
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.q._ainflight, {})
+
+
+class BulkTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.q = _make(kwess.Trader)
+        self.q._session = self.stub = StubSession()
+
+    def queried(self):
+        return [params["ids"] if params else url.rsplit("/", 1)[1] for _, url, params in self.stub.calls]
+
+    def test_order_duplicates_and_unknown_ids(self):
+        rd = self.q.get_market_quotes_bulk([3, 1, 404, 3, 2], chunk=2)
+        self.assertEqual([quote["symbolId"] for quote in rd["quotes"]], [3, 1, 3, 2])
+        self.assertEqual(self.queried(), ["3,1", "404,2"])
+
+    def test_only_uncached_ids_are_queried(self):
+        self.q.get_market_quotes_bulk("1,2")
+        rd = self.q.get_market_quotes_bulk("2,5,1,6")
+        self.assertEqual([quote["symbolId"] for quote in rd["quotes"]], [2, 5, 1, 6])
+        self.assertEqual(self.queried(), ["1,2", "5,6"])
+        self.q.get_market_quotes_bulk([6, 5, 2, 1])
+        self.assertEqual(len(self.stub.calls), 2)
+
+    def test_cache_false_queries_every_id(self):
+        self.q.get_symbols_by_ids_bulk("1,2")
+        rd = self.q.get_symbols_by_ids_bulk("2,3", cache=False)
+        self.assertEqual([symbol["symbolId"] for symbol in rd["symbols"]], [2, 3])
+        self.assertEqual(self.queried(), ["1,2", "2,3"])
+
+    def test_expired_items_are_queried_again(self):
+        self.q.get_market_quotes_bulk("1,2")
+        self.q._cache[("quote", "1")] = (0, {"symbolId": 1, "stale": True}, None)
+        rd = self.q.get_market_quotes_bulk("1,2")
+        self.assertEqual(rd["quotes"], [{"symbolId": 1}, {"symbolId": 2}])
+        self.assertEqual(self.queried(), ["1,2", "1"])
+
+
+class CacheStoreTest(TempDirTestCase):
+    def test_full_cache_drops_the_oldest_entries(self):
+        q = _make(kwess.Trader)
+        with mock.patch.object(kwess, "_CACHE_MAXSIZE", 3):
+            for key in "abcd":
+                q._cache_store(key, key, 60)
+            q._cache_store("b", "b2", 60)
+            q._cache_store("e", "e", 60)
+        self.assertEqual(list(q._cache), ["d", "b", "e"])
+        self.assertEqual(q._cache_lookup("b"), "b2")
+        self.assertIsNone(q._cache_lookup("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Checks of the module helpers.
+Run with: python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime as dt, timedelta as td, timezone
+from types import SimpleNamespace
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import kwess
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "refreshToken")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def mode(self):
+        return os.stat(self.path).st_mode & 0o777
+
+    @unittest.skipIf(os.name != "posix", "posix permissions")
+    def test_new_file_is_private(self):
+        kwess._atomic_write(self.path, b"RT1")
+        self.assertEqual(self.mode(), 0o600)
+
+    @unittest.skipIf(os.name != "posix", "posix permissions")
+    def test_replaced_file_keeps_its_mode(self):
+        for mode in (0o600, 0o640):
+            with open(self.path, "wb") as fp:
+                fp.write(b"RT1")
+            os.chmod(self.path, mode)
+            kwess._atomic_write(self.path, b"RT2")
+            self.assertEqual(self.mode(), mode)
+            with open(self.path, "rb") as fp:
+                self.assertEqual(fp.read(), b"RT2")
+
+    def test_failed_write_keeps_file_and_removes_temporary_file(self):
+        kwess._atomic_write(self.path, b"RT1")
+        with self.assertRaises(TypeError):
+            kwess._atomic_write(self.path, "not bytes")
+        with open(self.path, "rb") as fp:
+            self.assertEqual(fp.read(), b"RT1")
+        self.assertEqual(os.listdir(self._tmp.name), ["refreshToken"])
+
+
+class WindowsTest(unittest.TestCase):
+    def assertContiguous(self, windows, start, end):
+        self.assertEqual(windows[0][0], start)
+        self.assertEqual(windows[-1][1], end)
+        for (s1, e1), (s2, e2) in zip(windows, windows[1:]):
+            self.assertEqual(s2 - e1, td(seconds=1))
+        for s, e in windows:
+            self.assertLess(s, e)
+            self.assertLessEqual(e - s, td(days=29, seconds=1))
+
+    def test_up_to_29_days_is_one_window(self):
+        start = dt(2020, 1, 1)
+        for end in (start + td(hours=1), start + td(days=29)):
+            self.assertEqual(kwess._windows(start, end), [(start, end)])
+
+    def test_29_days_and_1_second_has_no_empty_window(self):
+        start = dt(2020, 1, 1)
+        end = start + td(days=29, seconds=1)
+        self.assertEqual(kwess._windows(start, end), [(start, end)])
+
+    def test_29_days_and_a_fraction_of_second(self):
+        start = dt(2020, 1, 1)
+        end = start + td(days=29, milliseconds=500)
+        self.assertEqual(kwess._windows(start, end), [(start, end)])
+
+    def test_several_full_windows(self):
+        start = dt(2020, 1, 1)
+        end = start + td(days=29 * 3, seconds=2)
+        windows = kwess._windows(start, end)
+        self.assertEqual(windows, [
+            (start, start + td(days=29)),
+            (start + td(days=29, seconds=1), start + td(days=58, seconds=1)),
+            (start + td(days=58, seconds=2), end),
+        ])
+        end = dt(2020, 4, 15)
+        windows = kwess._windows(start, end)
+        self.assertEqual(len(windows), 4)
+        self.assertContiguous(windows, start, end)
+
+    def test_aware_start_without_end(self):
+        start = dt.now(timezone.utc) - td(days=40)
+        windows = kwess._windows(start)
+        self.assertEqual(len(windows), 2)
+        self.assertIs(windows[-1][1].tzinfo, timezone.utc)
+        self.assertLess(dt.now(timezone.utc) - windows[-1][1], td(minutes=1))
+        self.assertContiguous(windows, start, windows[-1][1])
+
+    def test_end_before_start_is_one_window(self):
+        start, end = dt(2020, 2, 1), dt(2020, 1, 1)
+        self.assertEqual(kwess._windows(start, end), [(start, end)])
+
+
+class GetAllTest(unittest.TestCase):
+    @staticmethod
+    @kwess.Trader.get_all
+    def chunks(self, startdatetime, enddatetime=None):
+        if startdatetime.month == 2:
+            raise ValueError("February failed")
+        return startdatetime
+
+    def test_failed_chunk_raises_whatever_max_workers(self):
+        for max_workers in (1, 8):
+            with self.assertRaises(ValueError):
+                list(self.chunks(SimpleNamespace(max_workers=max_workers), dt(2020, 1, 1), dt(2020, 4, 15)))
+
+    def test_chunks_are_yielded_in_order(self):
+        for max_workers in (1, 8):
+            starts = list(self.chunks(SimpleNamespace(max_workers=max_workers), dt(2020, 3, 1), dt(2020, 6, 1)))
+            self.assertEqual(starts, sorted(starts))
+            self.assertEqual(len(starts), 4)
+            self.assertEqual(starts[0], dt(2020, 3, 1))
+
+
+class DatetimeStringTest(unittest.TestCase):
+    def setUp(self):
+        self.qdstr = kwess.Trader.object_to_qdstr.__get__(object())
+
+    def test_aware_datetimes_keep_their_offset(self):
+        self.assertEqual(self.qdstr(dt(2022, 1, 1, tzinfo=timezone.utc)), "2022-01-01T00:00:00+00:00")
+        self.assertEqual(self.qdstr(dt(2022, 1, 1, tzinfo=timezone(td(hours=5, minutes=30)))), "2022-01-01T00:00:00+05:30")
+        self.assertEqual(self.qdstr(dt(2022, 1, 1, tzinfo=timezone(td(hours=-5))), gmt=True), "2022-01-01T05:00:00+00:00")
+        self.assertEqual(self.qdstr(dt(2022, 1, 1), gmt=True), "2022-01-01T00:00:00+00:00")
+
+    @unittest.skipIf(not hasattr(time, "tzset"), "time.tzset")
+    def test_naive_datetimes_follow_daylight_saving(self):
+        saved = os.environ.get("TZ")
+        os.environ["TZ"] = "America/Toronto"
+        time.tzset()
+        try:
+            self.assertEqual(self.qdstr(dt(2022, 1, 1)), "2022-01-01T00:00:00-05:00")
+            self.assertEqual(self.qdstr(dt(2022, 7, 1)), "2022-07-01T00:00:00-04:00")
+        finally:
+            if saved is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = saved
+            time.tzset()
+
+
+class UnsentTest(unittest.TestCase):
+    def test_connection_never_established(self):
+        url = "https://login.questrade.com/oauth2/token"
+        self.assertTrue(kwess._unsent(requests.exceptions.ConnectTimeout("timed out")))
+        refused = NewConnectionError(None, "Connection refused")
+        self.assertTrue(kwess._unsent(requests.exceptions.ConnectionError(MaxRetryError(None, url, refused))))
+
+    def test_connection_lost_after_sending(self):
+        reset = ProtocolError("Connection aborted.", ConnectionResetError(104, "Connection reset by peer"))
+        self.assertFalse(kwess._unsent(requests.exceptions.ConnectionError(reset)))
+        self.assertFalse(kwess._unsent(requests.exceptions.ConnectionError()))
+
+
+if __name__ == "__main__":
+    unittest.main()